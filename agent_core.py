@@ -0,0 +1,781 @@
+"""Shared REPL, caches and helpers for the ClickHouse SQL agent"""
+import os
+import re
+import sys
+import asyncio
+import hashlib
+import pickle
+import time
+import difflib
+from collections import OrderedDict
+import numpy as np
+from prompt_toolkit import PromptSession
+from prompt_toolkit.history import FileHistory
+from langchain_community.utilities import SQLDatabase
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+from langchain_community.agent_toolkits.sql.base import create_sql_agent
+from langchain_community.agent_toolkits.sql.toolkit import SQLDatabaseToolkit
+from langchain_core.messages import SystemMessage
+from langchain_core.prompts import ChatPromptTemplate
+
+# --- REPL TEXT ---
+# Built once so the interactive loop only writes precomputed strings
+SEP_EQ = "=" * 60
+SEP_DASH = "-" * 60
+EXIT_COMMANDS = frozenset({"exit", "quit", "q"})
+HELP_COMMANDS = frozenset({"help", "?"})
+HELP_TEXT = "\n".join([
+    "",
+    "📖 Example questions:",
+    "  • What are the column names in [table_name]?",
+    "  • How many records are in [table_name]?",
+    "  • What is the average/sum/count of [column_name]?",
+    "  • Show me the top 10 records from [table_name]",
+    "  • Filter data by specific conditions",
+    "  • batch: questions.txt  (run one question per line concurrently)",
+    ""
+])
+GREETING_TEXT = "\n".join([
+    "",
+    "👋 Hello! I'm here to help you query the database.",
+    "💡 Ask me questions about the data, like:",
+    "   - Statistical queries (averages, counts, sums)",
+    "   - Data filtering and searching",
+    "   - Table structure information",
+    ""
+])
+
+# --- INTENT CLASSIFICATION ---
+# Obvious cases are classified locally; only ambiguous input reaches the LLM.
+# CHAT_RE must match the whole input so "hi, how many orders?" is still a query.
+CHAT_RE = re.compile(
+    r'^\s*(hi|hello|hey|how are you|thanks?|thank you|bye|who are you|lonely|sad)\b[\s!?.,]*$',
+    re.I
+)
+QUERY_RE = re.compile(
+    r'\b(select|count|sum|avg|average|top|show|list|how many|which|what is the|'
+    r'group by|filter|between|records?|rows?|tables?|columns?)\b',
+    re.I
+)
+
+# Static instructions come first and the user input last, so the long prefix is
+# identical on every call and can be served from the provider's prompt cache
+_CLASSIFIER_SYSTEM = """You are a query classifier for a database assistant.
+
+Database name: {db_name}
+Available tables: {table_list}
+
+Analyze the user input and determine if it's a legitimate database query or just casual conversation.
+
+Respond with ONLY one word:
+- "QUERY" if this is asking for data, statistics, information from the database, or wants to query/analyze the data
+- "CHAT" if this is a greeting, casual conversation, personal statement, off-topic question, or not related to querying the database
+
+Examples:
+- "hi" -> CHAT
+- "what's the average price?" -> QUERY
+- "I'm feeling lonely" -> CHAT
+- "show me top 10 records" -> QUERY
+- "how are you?" -> CHAT
+- "which town has highest sales?" -> QUERY"""
+
+def build_classifier_prompt(db_name, table_list):
+    """Build the classifier prompt once per session for a database"""
+    return ChatPromptTemplate.from_messages([
+        SystemMessage(content=_CLASSIFIER_SYSTEM.format(db_name=db_name, table_list=table_list)),
+        ("human", 'User input: "{question}"\nYour response (one word only):')
+    ])
+
+def _classify_locally(question):
+    """Return True/False for obvious queries/chat, or None when the LLM must decide"""
+    if CHAT_RE.match(question):
+        return False
+    if QUERY_RE.search(question):
+        return True
+    return None
+
+def _parse_classification(response):
+    # Handle different response formats
+    if hasattr(response, 'content'):
+        result = response.content.strip().upper()
+    elif isinstance(response, str):
+        result = response.strip().upper()
+    else:
+        result = str(response).strip().upper()
+    
+    return "QUERY" in result
+
+def is_data_query(question, llm, prompt):
+    """Determine if the question is a legitimate database query, using the LLM only when unsure
+
+    Pass llm=None to skip the LLM fallback and treat ambiguous input as a query.
+    """
+    local = _classify_locally(question)
+    if local is not None:
+        return local
+    if llm is None:
+        return True
+
+    try:
+        return _parse_classification(llm.invoke(prompt.format_messages(question=question)))
+    except Exception as e:
+        # If classification fails, be conservative and allow the query
+        print(f"⚠️  Classification failed: {e}")
+        return True
+
+async def classify_many(questions, llm, prompt):
+    """Like is_data_query for several questions, sending all ambiguous ones to the LLM at once"""
+    results = [_classify_locally(q) for q in questions]
+    ambiguous = [i for i, result in enumerate(results) if result is None]
+    if ambiguous and llm is not None:
+        responses = await llm.abatch(
+            [prompt.format_messages(question=questions[i]) for i in ambiguous],
+            return_exceptions=True
+        )
+        for i, response in zip(ambiguous, responses):
+            if isinstance(response, Exception):
+                # Left as None, so the query is conservatively allowed
+                print(f"⚠️  Classification failed: {response}")
+            else:
+                results[i] = _parse_classification(response)
+    return [result is not False for result in results]
+
+# --- SCHEMA VALIDATION ---
+# Identifiers the user names explicitly: "from x", "join x", "table x" and `x`
+TABLE_REF_RE = re.compile(r"\b(?:from|join|table)\s+(?:table\s+)?[`\"']?([A-Za-z_][\w.]*)", re.I)
+QUOTED_IDENT_RE = re.compile(r"`([^`]+)`")
+
+class TableSchema:
+    """Table names known at startup, with column names read only when first needed"""
+
+    def __init__(self, table_names, get_columns):
+        self.table_names = tuple(table_names)
+        self.tables = {t.lower() for t in self.table_names}
+        # get_columns(table) -> iterable of column names; one database query per table
+        self._get_columns = get_columns
+        self._columns = None
+
+    def columns(self):
+        """Map each table to its lower-cased column names, fetched once per session.
+
+        Tables whose columns could not be read map to None.
+        """
+        if self._columns is None:
+            self._columns = {}
+            for table in self.table_names:
+                try:
+                    self._columns[table.lower()] = {c.lower() for c in self._get_columns(table)}
+                except Exception as e:
+                    print(f"⚠️  Could not read columns for {table}: {e}")
+                    self._columns[table.lower()] = None
+        return self._columns
+
+def build_schema(db, table_names):
+    """Return a TableSchema that reads columns through the database inspector"""
+    return TableSchema(
+        table_names,
+        lambda table: [c["name"] for c in db._inspector.get_columns(table)]
+    )
+
+def _is_known(name, known):
+    # Accept database-qualified names and simple singular/plural variants
+    name = name.lower().rsplit(".", 1)[-1]
+    return name in known or name + "s" in known or name.rstrip("s") in known
+
+def find_unknown_identifiers(question, schema):
+    """Return (identifier, suggestion) pairs for likely misspelled names in the question.
+
+    Names after from/join/table are checked against tables, backticked names against
+    tables and columns. A name is only reported when it looks like a typo of a known
+    one, since it may just be plain English ("customers from Germany") or a value
+    (`shipped`). Backticked names are not checked at all if some table's columns
+    are unknown, so valid columns of that table are never rejected. Columns are only
+    read from the database the first time a question contains a backticked name.
+    """
+    candidates = [(TABLE_REF_RE.findall(question), schema.tables)]
+    quoted = QUOTED_IDENT_RE.findall(question)
+    if quoted:
+        columns = schema.columns()
+        if all(cols is not None for cols in columns.values()):
+            candidates.append((quoted, schema.tables.union(*columns.values())))
+
+    unknown = []
+    for names, known in candidates:
+        for name in names:
+            if _is_known(name, known):
+                continue
+            matches = difflib.get_close_matches(name.lower(), known, n=1, cutoff=0.8)
+            if matches:
+                unknown.append((name, matches[0]))
+    return unknown
+
+def report_unknown_identifiers(unknown, table_list):
+    """Print the unknown identifiers with their closest known names"""
+    print("\n" + SEP_EQ)
+    print("⚠️  UNKNOWN TABLE OR COLUMN")
+    print(SEP_EQ)
+    for name, suggestion in unknown:
+        print(f"❌ `{name}` doesn't exist. Did you mean `{suggestion}`?")
+    print(f"💡 Available tables: {table_list}")
+    print(SEP_DASH)
+
+# --- RESPONSE CACHE ---
+EMBEDDING_DIM = 1536  # text-embedding-3-small
+# AgentExecutor returns this (with varying endings) instead of an answer when it
+# runs out of iterations or time
+AGENT_STOPPED_PREFIX = "Agent stopped due to"
+# Numbers and quoted values; questions that differ only in these ("orders in
+# 2023" vs "orders in 2024") embed almost identically but need different answers
+LITERAL_RE = re.compile(r"\d+(?:\.\d+)?|'[^']*'|\"[^\"]*\"")
+
+def _literals(question):
+    return sorted(LITERAL_RE.findall(question.strip().lower()))
+
+class LRU(OrderedDict):
+    """OrderedDict capped at `cap` entries, evicting the least recently used"""
+
+    def __init__(self, cap=256):
+        super().__init__()
+        self.cap = cap
+
+    def get(self, key, default=None):
+        if key not in self:
+            return default
+        self.move_to_end(key)
+        return self[key]
+
+    def set(self, key, value):
+        """Insert or refresh an entry and return the keys evicted to stay within the cap"""
+        self[key] = value
+        self.move_to_end(key)
+        evicted = []
+        while len(self) > self.cap:
+            evicted.append(self.popitem(last=False)[0])
+        return evicted
+
+class CachingAgent:
+    """Wrap the agent executor with an exact-match and semantic response cache"""
+
+    def __init__(self, agent, db_name, max_entries=512, max_query_vectors=2048,
+                 similarity_threshold=0.92, ttl=3600, cache_file=None):
+        self.agent = agent
+        self.db_name = db_name
+        # Answers reflect live data, so entries older than ttl seconds are misses
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.cache_file = cache_file
+        self._embeddings = None
+        # Both caches are bounded so long sessions keep a flat memory footprint:
+        # key -> (stored_at, normalized question, output), and
+        # normalized question text -> embedding
+        self._outputs = LRU(max_entries)
+        self._query_vectors = LRU(max_query_vectors)
+        # Normalized float32 embeddings, one row per key in self._keys, so a
+        # semantic lookup is a single matrix-vector product
+        self._keys = []
+        self._emb = np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+        self._load()
+
+    def _is_final_answer(self, output, steps):
+        """Only real answers are cached, not empty output or early-stop messages"""
+        if not output.strip() or output.startswith(AGENT_STOPPED_PREFIX):
+            return False
+        max_iterations = getattr(self.agent, "max_iterations", None)
+        return max_iterations is None or steps < max_iterations
+
+    def _key(self, question):
+        normalized = question.strip().lower()
+        return hashlib.sha256(f"{self.db_name}|{normalized}".encode("utf-8")).hexdigest()
+
+    def _embed_many(self, questions):
+        """Return unit-length embeddings for several questions in one API call.
+
+        Entries are None if the embeddings API is unavailable. Questions embedded
+        earlier in the session are served from memory.
+        """
+        texts = [q.strip().lower() for q in questions]
+        missing = list(dict.fromkeys(t for t in texts if t not in self._query_vectors))
+        if missing:
+            try:
+                if self._embeddings is None:
+                    # This runs before every uncached question, so fail fast and
+                    # fall back to the exact-match cache instead of stalling the turn
+                    self._embeddings = OpenAIEmbeddings(
+                        model="text-embedding-3-small",
+                        request_timeout=5,
+                        max_retries=1
+                    )
+                matrix = np.asarray(self._embeddings.embed_documents(missing), dtype=np.float32)
+            except Exception as e:
+                print(f"⚠️  Embedding failed, using exact-match cache only: {e}")
+                return [None] * len(questions)
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            norms[norms == 0] = 1
+            for text, vector in zip(missing, matrix / norms):
+                self._query_vectors.set(text, vector)
+        return [self._query_vectors.get(t) for t in texts]
+
+    def _embed(self, question):
+        """Return a unit-length embedding, or None if the embeddings API is unavailable"""
+        return self._embed_many([question])[0]
+
+    def _get_fresh(self, key):
+        """Return the cached output for key, evicting it if it has expired"""
+        entry = self._outputs.get(key)
+        if entry is None:
+            return None
+        stored_at, _, output = entry
+        if time.time() - stored_at > self.ttl:
+            del self._outputs[key]
+            self._drop_vectors([key])
+            return None
+        return output
+
+    def _semantic_lookup(self, vector, question):
+        """Return the key of the most similar cached question with the same literals"""
+        if vector is None or not self._keys:
+            return None
+        scores = self._emb @ vector
+        literals = _literals(question)
+        for row in np.argsort(-scores):
+            if scores[row] <= self.similarity_threshold:
+                break
+            key = self._keys[row]
+            if key in self._outputs and _literals(self._outputs[key][1]) == literals:
+                return key
+        return None
+
+    def _store(self, key, question, output, vector, save=True):
+        if vector is not None:
+            if key in self._keys:
+                self._emb[self._keys.index(key)] = vector
+            else:
+                self._keys.append(key)
+                self._emb = np.vstack([self._emb, vector[np.newaxis, :]])
+        entry = (time.time(), question.strip().lower(), output)
+        self._drop_vectors(self._outputs.set(key, entry))
+        if save:
+            self._save()
+
+    def _drop_vectors(self, keys):
+        """Remove the embedding rows of evicted cache entries"""
+        rows = {self._keys.index(k) for k in keys if k in self._keys}
+        if rows:
+            self._emb = np.delete(self._emb, sorted(rows), axis=0)
+            self._keys = [k for i, k in enumerate(self._keys) if i not in rows]
+
+    def _read_file(self):
+        """Return the persisted {db_name: (outputs, keys, emb)} mapping"""
+        if not self.cache_file or not os.path.exists(self.cache_file):
+            return {}
+        with open(self.cache_file, "rb") as f:
+            data = pickle.load(f)
+        return data if isinstance(data, dict) else {}
+
+    def _load(self):
+        try:
+            # Each database has its own section, so the embedding matrix never
+            # matches questions that were answered against another database
+            section = self._read_file().get(self.db_name)
+            if section is None:
+                return
+            outputs, keys, emb = section
+            self._keys = list(keys)
+            self._emb = np.asarray(emb, dtype=np.float32)
+            for key, entry in outputs.items():
+                self._drop_vectors(self._outputs.set(key, entry))
+            # Drop entries that expired while the cache was on disk
+            for key in list(self._outputs):
+                self._get_fresh(key)
+        except Exception as e:
+            print(f"⚠️  Could not load response cache: {e}")
+            # Start empty rather than with a partially loaded cache
+            self._outputs.clear()
+            self._keys = []
+            self._emb = np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+
+    def _save(self):
+        if not self.cache_file:
+            return
+        try:
+            data = self._read_file()
+            data[self.db_name] = (dict(self._outputs), self._keys, self._emb)
+            with open(self.cache_file, "wb") as f:
+                pickle.dump(data, f)
+        except Exception as e:
+            print(f"⚠️  Could not save response cache: {e}")
+
+    def stream(self, inputs):
+        """Yield agent chunks as they are produced, or a single chunk for a cached answer"""
+        question = inputs["input"]
+        key, cached, vector = self._lookup(question)
+        if cached is not None:
+            yield {"input": question, "output": cached, "cached": True}
+            return
+
+        # Exceptions propagate to the caller and nothing is cached
+        output = []
+        steps = 0
+        for chunk in self.agent.stream(inputs):
+            if "output" in chunk:
+                output.append(chunk["output"])
+            steps += len(chunk.get("steps", ()))
+            yield chunk
+        output = "".join(output)
+        if self._is_final_answer(output, steps):
+            self._store(key, question, output, vector)
+
+    def _lookup(self, question):
+        """Return (key, cached output or None, embedding) for a question"""
+        key = self._key(question)
+        cached = self._get_fresh(key)
+        if cached is not None:
+            return key, cached, None
+        vector = self._embed(question)
+        match = self._semantic_lookup(vector, question)
+        cached = self._get_fresh(match) if match is not None else None
+        return key, cached, vector
+
+    async def abatch(self, questions, max_concurrency=8):
+        """Answer several questions, running cache misses concurrently.
+
+        Returns one response dict or exception per question, in input order.
+        """
+        results = [None] * len(questions)
+        misses = []
+        for i, question in enumerate(questions):
+            key = self._key(question)
+            cached = self._get_fresh(key)
+            if cached is not None:
+                results[i] = {"input": question, "output": cached, "cached": True}
+            else:
+                misses.append((i, key))
+
+        # Embed all exact-match misses with a single request
+        pending = []
+        vectors = self._embed_many([questions[i] for i, _ in misses]) if misses else []
+        for (i, key), vector in zip(misses, vectors):
+            match = self._semantic_lookup(vector, questions[i])
+            cached = self._get_fresh(match) if match is not None else None
+            if cached is not None:
+                results[i] = {"input": questions[i], "output": cached, "cached": True}
+            else:
+                pending.append((i, key, vector))
+
+        if pending:
+            responses = await self.agent.abatch(
+                [{"input": questions[i]} for i, _, _ in pending],
+                config={"max_concurrency": max_concurrency},
+                return_exceptions=True
+            )
+            for (i, key, vector), response in zip(pending, responses):
+                if not isinstance(response, Exception):
+                    output = response.get("output", "")
+                    steps = len(response.get("intermediate_steps", ()))
+                    if self._is_final_answer(output, steps):
+                        self._store(key, questions[i], output, vector, save=False)
+                results[i] = response
+            self._save()
+        return results
+
+    def invoke(self, inputs):
+        """Return a cached answer when possible, otherwise run the agent and cache its output"""
+        response = {"input": inputs["input"], "output": ""}
+        for chunk in self.stream(inputs):
+            if "output" in chunk:
+                response["output"] += chunk["output"]
+            response["cached"] = chunk.get("cached", False)
+        return response
+
+def format_response(response):
+    """Format the agent response in a user-friendly way"""
+    if isinstance(response, dict):
+        output = response.get("output", "")
+    else:
+        output = str(response)
+    
+    # Clean up common agent artifacts
+    output = output.replace("```sql", "").replace("```", "").strip()
+    
+    return output
+
+# --- ERROR REPORTING ---
+# One pass over the error text collects the matching group names
+ERR_RE = re.compile(
+    r"(?P<timeout>timeout|timed out)|(?P<syntax>syntax|parse)|"
+    r"(?P<missing>not found|no such|doesn't exist)|(?P<perm>permission|access denied)",
+    re.I
+)
+
+def _h_timeout(table_list):
+    print("⏱️  The query took too long to execute.")
+    print("💡 Try simplifying your question or adding filters to reduce data.")
+
+def _h_syntax(table_list):
+    print("❌ There was a problem understanding your question.")
+    print("💡 Try rephrasing it more clearly or use simpler terms.")
+
+def _h_missing(table_list):
+    print("❌ The requested table or column doesn't exist.")
+    print(f"💡 Available tables: {table_list}")
+
+def _h_perm(table_list):
+    print("❌ Permission denied for this operation.")
+
+def _h_generic(table_list):
+    print("❌ Unable to process your query.")
+    print("💡 Try rephrasing or asking a different question.")
+
+# Checked in this order when several kinds of error are mentioned
+ERROR_HANDLERS = {
+    "timeout": _h_timeout,
+    "syntax": _h_syntax,
+    "missing": _h_missing,
+    "perm": _h_perm,
+}
+
+def explain_error(error, table_list):
+    """Print a user-friendly explanation for an agent error"""
+    found = {match.lastgroup for match in ERR_RE.finditer(str(error))}
+    kind = next((kind for kind in ERROR_HANDLERS if kind in found), None)
+    ERROR_HANDLERS.get(kind, _h_generic)(table_list)
+
+# --- OUTPUT ---
+def stream_answer(agent, question):
+    """Print the agent's answer as soon as it is available and return the full text"""
+    answer = []
+    for chunk in agent.stream({"input": question}):
+        if "output" not in chunk:
+            continue
+        # Intermediate agent steps are logged by the executor; print the header
+        # only once the final answer starts arriving
+        if not answer:
+            print("\n" + SEP_EQ)
+            print("📈 RESULT:" + ("  ⚡ (cached)" if chunk.get("cached") else ""))
+            print(SEP_EQ)
+        text = format_response(chunk)
+        sys.stdout.write(text)
+        sys.stdout.flush()
+        answer.append(text)
+    print()
+    print(SEP_DASH)
+    return "".join(answer)
+
+def run_batch(agent, path, classifier_llm, classifier_prompt, schema, table_list):
+    """Answer every question in a file (one per line) concurrently"""
+    try:
+        with open(path, encoding="utf-8") as f:
+            lines = [line.strip() for line in f]
+    except OSError as e:
+        print(f"❌ Could not read batch file: {e}")
+        return
+
+    questions = [q for q in lines if q and not q.startswith("#")]
+    is_query = asyncio.run(classify_many(questions, classifier_llm, classifier_prompt))
+    queries = [q for q, keep in zip(questions, is_query) if keep]
+    skipped = len(questions) - len(queries)
+    if skipped:
+        print(f"💡 Skipping {skipped} line(s) that don't look like database queries.")
+
+    # Lines with misspelled tables/columns are reported instead of costing an agent run
+    valid = []
+    for question in queries:
+        unknown = find_unknown_identifiers(question, schema)
+        if unknown:
+            print(f"\n❓ {question}")
+            report_unknown_identifiers(unknown, table_list)
+        else:
+            valid.append(question)
+    queries = valid
+    if not queries:
+        return
+
+    print(f"\n🔍 Processing {len(queries)} queries...\n")
+    responses = asyncio.run(agent.abatch(queries))
+
+    for question, response in zip(queries, responses):
+        print("\n" + SEP_EQ)
+        print(f"❓ {question}")
+        print(SEP_EQ)
+        if isinstance(response, Exception):
+            explain_error(response, table_list)
+        else:
+            print(format_response(response))
+        print(SEP_DASH)
+
+# --- ENTRY POINT ---
+def run_repl(db_uri, db_name, classifier_enabled=True, max_iterations=5, include_tables=None,
+             classifier_model="gpt-4o-mini", cache_file=None, cache_ttl=3600,
+             history_file="~/.chagent_history",
+             verbose=False):
+    """Connect to ClickHouse, build the SQL agent and run the interactive session"""
+    # --- DATABASE CONNECTION ---
+    try:
+        # Skip sample rows and reflect tables lazily to keep schema prompts small, and
+        # keep warm connections around since the agent issues many small queries
+        db = SQLDatabase.from_uri(
+            db_uri,
+            include_tables=include_tables,
+            sample_rows_in_table_info=0,
+            lazy_table_reflection=True,
+            engine_args={
+                "pool_size": 10,
+                "max_overflow": 20,
+                "pool_pre_ping": True,
+                "pool_recycle": 1800
+            }
+        )
+        # Table names don't change during a session, so fetch them only once
+        table_names = tuple(db.get_usable_table_names())
+        table_list = ', '.join(table_names)
+        if verbose:
+            print("Database dialect:", db.dialect)
+            print("Usable tables:", table_list)
+        print("--- Connection Successful ---")
+    except Exception as e:
+        print(f"ERROR: Failed to connect to the database. {e}")
+        sys.exit(1)
+
+    # --- AGENT CREATION ---
+    try:
+        llm = ChatOpenAI(
+            model="gpt-4o-mini",
+            temperature=0,
+            streaming=True,
+            max_tokens=512,
+            timeout=30,
+            max_retries=2
+        )
+        # The intent classifier only needs a one-word answer, so it gets its own
+        # small, non-streaming handle that can point at a cheaper model
+        classifier_llm = None
+        if classifier_enabled:
+            classifier_llm = ChatOpenAI(model=classifier_model, temperature=0, max_tokens=2)
+        toolkit = SQLDatabaseToolkit(db=db, llm=llm)
+        agent_executor = create_sql_agent(
+            llm=llm, 
+            toolkit=toolkit, 
+            verbose=True,
+            handle_parsing_errors=True,
+            max_iterations=max_iterations,
+            max_execution_time=60
+        )
+        print("--- SQL Agent Created ---")
+    except Exception as e:
+        print(f"ERROR: Failed to create SQL agent. {e}")
+        sys.exit(1)
+
+    classifier_prompt = build_classifier_prompt(db_name, table_list)
+    schema = build_schema(db, table_names)
+
+    def is_query(question):
+        return is_data_query(question, classifier_llm, classifier_prompt)
+
+    # --- INTERACTIVE SESSION ---
+    cached_agent = CachingAgent(agent_executor, db_name, ttl=cache_ttl, cache_file=cache_file)
+
+    print("\n" + SEP_EQ)
+    print("    📊 DATABASE QUERY ASSISTANT")
+    print(SEP_EQ)
+    print(f"\nConnected to database: {db_name}")
+    print(f"Available tables: {table_list}")
+    print("\nAsk questions about the data in natural language.")
+    print("Type 'exit', 'quit', or 'q' to end the session.")
+    print("Type 'help' to see example questions.")
+    print("Type 'batch: <file>' to run a file of questions concurrently.")
+    print(SEP_DASH)
+
+    consecutive_errors = 0
+    max_consecutive_errors = 3
+
+    # Persistent history lets previous questions be recalled with the arrow keys
+    session = PromptSession(history=FileHistory(os.path.expanduser(history_file)))
+
+    while True:
+        try:
+            print()
+            question = session.prompt("💬 > ").strip()
+            q_low = question.lower()
+
+            # Handle exit commands
+            if q_low in EXIT_COMMANDS:
+                print("\n👋 Goodbye!")
+                break
+
+            # Handle empty input
+            if not question:
+                continue
+
+            # Handle help command
+            if q_low in HELP_COMMANDS:
+                sys.stdout.write(HELP_TEXT)
+                continue
+
+            # Handle batch files
+            if q_low.startswith("batch:"):
+                run_batch(
+                    cached_agent,
+                    question[len("batch:"):].strip(),
+                    classifier_llm,
+                    classifier_prompt,
+                    schema,
+                    table_list
+                )
+                continue
+
+            # Check for greetings and casual conversation
+            if not is_query(question):
+                sys.stdout.write(GREETING_TEXT)
+                consecutive_errors = 0
+                continue
+
+            # Catch misspelled tables/columns locally instead of spending a full agent run
+            unknown = find_unknown_identifiers(question, schema)
+            if unknown:
+                report_unknown_identifiers(unknown, table_list)
+                continue
+
+            print("\n🔍 Processing your query...\n")
+
+            # Execute the agent
+            try:
+                stream_answer(cached_agent, question)
+
+                # Reset error counter on success
+                consecutive_errors = 0
+
+            except KeyboardInterrupt:
+                print("\n\n⚠️  Query interrupted by user.")
+                raise
+
+            except Exception as agent_error:
+                consecutive_errors += 1
+
+                print("\n" + SEP_EQ)
+                print("⚠️  QUERY FAILED")
+                print(SEP_EQ)
+
+                # Provide user-friendly error messages
+                explain_error(agent_error, table_list)
+
+                if consecutive_errors >= max_consecutive_errors:
+                    print("\n⚠️  Multiple consecutive errors detected. Connection may be unstable.")
+                    print("💡 Consider restarting the session if issues persist.")
+                    consecutive_errors = 0
+
+                print(SEP_DASH)
+
+        except KeyboardInterrupt:
+            print("\n\n👋 Session interrupted. Goodbye!")
+            break
+
+        except Exception as outer_error:
+            print(f"\n❌ Unexpected error: {type(outer_error).__name__}")
+            print("💡 The session will continue. Type 'exit' to quit.")
+            consecutive_errors += 1
+
+            if consecutive_errors >= max_consecutive_errors:
+                print("\n⚠️  Too many errors. Exiting for safety.")
+                break
+
+    print("\n--- Session Ended ---")
@@ -0,0 +1,388 @@
+import asyncio
+import pickle
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from agent_core import (
+    EMBEDDING_DIM,
+    CachingAgent,
+    LRU,
+    TableSchema,
+    build_classifier_prompt,
+    classify_many,
+    explain_error,
+    find_unknown_identifiers,
+    is_data_query,
+    run_batch,
+)
+
+
+class FakeEmbeddings:
+    """Deterministic embeddings: each distinct text gets its own axis, unless aliased"""
+
+    def __init__(self, aliases=None):
+        self.aliases = aliases or {}
+        self.axes = {}
+        self.calls = 0
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        vectors = []
+        for text in texts:
+            text = self.aliases.get(text, text)
+            axis = self.axes.setdefault(text, len(self.axes))
+            vector = np.zeros(EMBEDDING_DIM, dtype=np.float32)
+            vector[axis] = 1.0
+            vectors.append(vector)
+        return vectors
+
+
+class FakeAgent:
+    """Mimics AgentExecutor.stream/abatch with a fixed answer and number of tool steps"""
+
+    max_iterations = 5
+
+    def __init__(self, output="42 orders", steps=1):
+        self.output = output
+        self.steps = steps
+        self.calls = 0
+
+    def stream(self, inputs):
+        self.calls += 1
+        for _ in range(self.steps):
+            yield {"steps": [object()]}
+        yield {"output": self.output}
+
+    async def abatch(self, inputs, config=None, return_exceptions=False):
+        self.calls += len(inputs)
+        return [
+            {"input": i["input"], "output": self.output, "intermediate_steps": [object()] * self.steps}
+            for i in inputs
+        ]
+
+
+def test_lru_evicts_least_recently_used():
+    lru = LRU(cap=2)
+    assert lru.set("a", 1) == []
+    assert lru.set("b", 2) == []
+    assert lru.get("a") == 1  # refreshes "a"
+    assert lru.set("c", 3) == ["b"]
+    assert list(lru) == ["a", "c"]
+    assert lru.get("b", "missing") == "missing"
+
+
+def test_lru_set_refreshes_existing_key():
+    lru = LRU(cap=2)
+    lru.set("a", 1)
+    lru.set("b", 2)
+    assert lru.set("a", 10) == []
+    assert lru.set("c", 3) == ["b"]
+    assert dict(lru) == {"a": 10, "c": 3}
+
+
+def make_cache(agent=None, aliases=None, db_name="shop", **kwargs):
+    cache = CachingAgent(agent or FakeAgent(), db_name, **kwargs)
+    cache._embeddings = FakeEmbeddings(aliases)
+    return cache
+
+
+def test_exact_repeat_is_served_from_cache():
+    agent = FakeAgent()
+    cache = make_cache(agent)
+    assert cache.invoke({"input": "How many orders?"})["cached"] is False
+    response = cache.invoke({"input": "  how many ORDERS? "})
+    assert response == {"input": "  how many ORDERS? ", "output": "42 orders", "cached": True}
+    assert agent.calls == 1
+
+
+def test_similar_question_is_served_from_cache():
+    agent = FakeAgent()
+    cache = make_cache(agent, aliases={"count the orders": "how many orders?"})
+    cache.invoke({"input": "How many orders?"})
+    assert cache.invoke({"input": "Count the orders"})["cached"] is True
+    assert agent.calls == 1
+
+
+@pytest.mark.parametrize("cached, other", [
+    ("how many orders in 2023?", "how many orders in 2024?"),
+    ("show the top 5 customers", "show the top 10 customers"),
+    ("orders from country 'de'", "orders from country 'tr'"),
+])
+def test_similar_question_with_different_literals_is_a_miss(cached, other):
+    agent = FakeAgent()
+    cache = make_cache(agent, aliases={other: cached})
+    cache.invoke({"input": cached})
+    assert cache.invoke({"input": other})["cached"] is False
+    assert agent.calls == 2
+
+    batch_cache = make_cache(agent, aliases={other: cached})
+    batch_cache.invoke({"input": cached})
+    assert asyncio.run(batch_cache.abatch([other]))[0].get("cached") is None
+    assert agent.calls == 4
+
+
+def test_similar_question_with_same_literals_is_a_hit():
+    agent = FakeAgent()
+    cache = make_cache(agent, aliases={"count orders placed in 2024": "how many orders in 2024?"})
+    cache.invoke({"input": "How many orders in 2024?"})
+    assert cache.invoke({"input": "Count orders placed in 2024"})["cached"] is True
+    assert agent.calls == 1
+
+
+@pytest.mark.parametrize("agent", [
+    FakeAgent(output=""),
+    FakeAgent(output="Agent stopped due to iteration limit or time limit."),
+    FakeAgent(output="Agent stopped due to max iterations."),
+    FakeAgent(steps=FakeAgent.max_iterations),
+])
+def test_incomplete_answers_are_not_cached(agent):
+    cache = make_cache(agent)
+    cache.invoke({"input": "How many orders?"})
+    assert cache.invoke({"input": "How many orders?"})["cached"] is False
+    assert agent.calls == 2
+
+
+def test_eviction_keeps_embedding_rows_aligned():
+    cache = make_cache(max_entries=2)
+    for question in ["q1", "q2", "q3", "q4"]:
+        cache.invoke({"input": question})
+
+    assert cache._keys == list(cache._outputs)
+    assert cache._emb.shape == (2, EMBEDDING_DIM)
+    for row, key in enumerate(cache._keys):
+        assert cache._semantic_lookup(cache._emb[row], cache._outputs[key][1]) == key
+
+
+def test_drop_vectors_removes_matching_rows_only():
+    cache = make_cache()
+    for question in ["q1", "q2", "q3"]:
+        cache.invoke({"input": question})
+    first, second, third = cache._keys
+    kept = cache._emb[[0, 2]].copy()
+
+    cache._drop_vectors([second, "unknown-key"])
+
+    assert cache._keys == [first, third]
+    np.testing.assert_array_equal(cache._emb, kept)
+
+
+def backdate(cache, seconds):
+    for key, (stored_at, question, output) in list(cache._outputs.items()):
+        cache._outputs[key] = (stored_at - seconds, question, output)
+
+
+def test_expired_answers_are_misses():
+    agent = FakeAgent()
+    cache = make_cache(agent, aliases={"count the orders": "how many orders?"}, ttl=60)
+    cache.invoke({"input": "How many orders?"})
+    backdate(cache, 120)
+    assert cache.invoke({"input": "Count the orders"})["cached"] is False
+    backdate(cache, 120)
+    assert cache.invoke({"input": "How many orders?"})["cached"] is False
+    assert agent.calls == 3
+    assert len(cache._outputs) == len(cache._keys) == cache._emb.shape[0] == 1
+
+
+def test_cache_file_round_trip(tmp_path):
+    cache_file = str(tmp_path / "cache.pkl")
+    cache = make_cache(cache_file=cache_file)
+    cache.invoke({"input": "How many orders?"})
+    cache.invoke({"input": "How many customers?"})
+
+    agent = FakeAgent()
+    restored = make_cache(agent, cache_file=cache_file)
+    assert list(restored._outputs) == list(cache._outputs)
+    assert restored._keys == cache._keys
+    np.testing.assert_array_equal(restored._emb, cache._emb)
+    assert restored.invoke({"input": "how many customers?"})["cached"] is True
+    assert agent.calls == 0
+
+
+def test_cache_file_drops_expired_entries(tmp_path):
+    cache_file = str(tmp_path / "cache.pkl")
+    cache = make_cache(cache_file=cache_file, ttl=60)
+    cache.invoke({"input": "How many orders?"})
+    backdate(cache, 120)
+    cache._save()
+
+    restored = make_cache(cache_file=cache_file, ttl=60)
+    assert len(restored._outputs) == len(restored._keys) == restored._emb.shape[0] == 0
+
+
+def test_unreadable_cache_file_starts_empty(tmp_path):
+    cache_file = tmp_path / "cache.pkl"
+    # Entry layout from before questions were stored alongside answers
+    vector = np.zeros((1, EMBEDDING_DIM), dtype=np.float32)
+    old = {"shop": ({"k": (time.time(), "42 orders")}, ["k"], vector)}
+    cache_file.write_bytes(pickle.dumps(old))
+
+    cache = make_cache(cache_file=str(cache_file))
+    assert len(cache._outputs) == len(cache._keys) == cache._emb.shape[0] == 0
+    assert cache.invoke({"input": "How many orders?"})["cached"] is False
+
+
+def test_cache_file_is_separated_by_database(tmp_path):
+    cache_file = str(tmp_path / "cache.pkl")
+    shop = make_cache(db_name="shop", cache_file=cache_file)
+    shop.invoke({"input": "How many orders?"})
+
+    agent = FakeAgent()
+    other = make_cache(agent, db_name="warehouse", cache_file=cache_file)
+    assert len(other._outputs) == len(other._keys) == 0
+    assert other.invoke({"input": "How many orders?"})["cached"] is False
+    assert agent.calls == 1
+
+    # Saving the second database keeps the first one's entries
+    assert len(make_cache(db_name="shop", cache_file=cache_file)._outputs) == 1
+
+
+def test_abatch_does_not_cache_incomplete_answers():
+    agent = FakeAgent(steps=FakeAgent.max_iterations)
+    cache = make_cache(agent)
+    asyncio.run(cache.abatch(["How many orders?"]))
+    asyncio.run(cache.abatch(["How many orders?"]))
+    assert agent.calls == 2
+
+
+@pytest.mark.parametrize("question", ["hi", "Hello!", "  thanks.", "how are you?", "bye"])
+def test_greetings_are_chat(question):
+    assert is_data_query(question, None, None) is False
+
+
+@pytest.mark.parametrize("question", [
+    "hi, how many orders were placed last week?",
+    "thanks! now count rows in orders",
+    "hey can you show top 10 customers",
+    "What is the average price?",
+    # Ambiguous input falls through to the query path when no LLM is configured
+    "I'm feeling lonely",
+])
+def test_queries_and_ambiguous_input_are_queries(question):
+    assert is_data_query(question, None, None) is True
+
+
+@pytest.mark.parametrize("error, expected", [
+    ("Request timed out", "took too long"),
+    ("Syntax error at position 12", "problem understanding"),
+    ("Table shop.ordrs doesn't exist", "Available tables: orders, customers"),
+    ("ACCESS DENIED for user default", "Permission denied"),
+    ("Connection reset by peer", "Unable to process"),
+    # Several matches: timeout wins over syntax regardless of position
+    ("parse error in query after timeout", "took too long"),
+    ("permission denied: table not found", "doesn't exist"),
+])
+def test_explain_error(capsys, error, expected):
+    explain_error(Exception(error), "orders, customers")
+    assert expected in capsys.readouterr().out
+
+
+COLUMNS = {
+    "customers": ["customer_id", "name", "join_date", "country"],
+    "orders": ["order_id", "customer_id", "product_name", "total_price", "order_date"],
+}
+
+
+class FakeColumnReader:
+    """Stands in for the database inspector, counting column queries"""
+
+    def __init__(self, failing=()):
+        self.failing = failing
+        self.calls = 0
+
+    def __call__(self, table):
+        self.calls += 1
+        if table in self.failing:
+            raise RuntimeError("inspection failed")
+        return COLUMNS[table]
+
+
+SCHEMA = TableSchema(COLUMNS, FakeColumnReader())
+
+
+@pytest.mark.parametrize("question", [
+    "List all products bought by customers from Germany (DE).",
+    "How many orders from customer John Doe?",
+    "select * from e_commerce_analytics.orders",
+    "what is the `country` distribution of customers",
+    "orders where status = `shipped`",
+])
+def test_valid_questions_pass_schema_check(question):
+    assert find_unknown_identifiers(question, SCHEMA) == []
+
+
+@pytest.mark.parametrize("question, expected", [
+    ("show rows from custmers", [("custmers", "customers")]),
+    ("top rows from table ordrs", [("ordrs", "orders")]),
+    ("average of `total_prce` per order", [("total_prce", "total_price")]),
+])
+def test_typos_are_reported_with_suggestion(question, expected):
+    assert find_unknown_identifiers(question, SCHEMA) == expected
+
+
+def test_backticks_are_not_checked_when_columns_are_unknown():
+    schema = TableSchema(COLUMNS, FakeColumnReader(failing={"orders"}))
+    assert find_unknown_identifiers("sum of `total_prce`", schema) == []
+    assert find_unknown_identifiers("rows from ordrs", schema) == [("ordrs", "orders")]
+
+
+def test_columns_are_read_once_and_only_for_backticked_names():
+    reader = FakeColumnReader()
+    schema = TableSchema(COLUMNS, reader)
+
+    assert find_unknown_identifiers("show rows from custmers", schema) == [("custmers", "customers")]
+    assert reader.calls == 0
+
+    find_unknown_identifiers("average of `total_prce`", schema)
+    find_unknown_identifiers("count of `country`", schema)
+    assert reader.calls == len(COLUMNS)
+
+
+def test_run_batch_skips_lines_that_fail_schema_check(tmp_path, capsys):
+    path = tmp_path / "questions.txt"
+    path.write_text("# comment\nhello\nshow rows from custmers\nhow many orders?\n", encoding="utf-8")
+    agent = FakeAgent()
+    cache = make_cache(agent)
+
+    run_batch(cache, str(path), None, None, SCHEMA, "customers, orders")
+
+    out = capsys.readouterr().out
+    assert "Did you mean `customers`?" in out
+    assert "❓ how many orders?" in out
+    assert agent.calls == 1
+
+
+class FakeClassifier:
+    """Answers CHAT for inputs mentioning "lonely" and QUERY otherwise, batched only"""
+
+    def __init__(self):
+        self.batches = []
+
+    def invoke(self, messages):
+        raise AssertionError("batch classification must not call invoke")
+
+    async def abatch(self, inputs, return_exceptions=False):
+        self.batches.append(len(inputs))
+        return [
+            SimpleNamespace(content="CHAT" if "lonely" in messages[-1].content else "QUERY")
+            for messages in inputs
+        ]
+
+
+def test_classify_many_sends_ambiguous_lines_in_one_batch():
+    llm = FakeClassifier()
+    prompt = build_classifier_prompt("shop", "customers, orders")
+    questions = [
+        "hi",
+        "how many orders?",
+        "I'm feeling lonely",
+        "revenue by country",
+        "best selling product",
+    ]
+
+    result = asyncio.run(classify_many(questions, llm, prompt))
+
+    assert result == [False, True, False, True, True]
+    assert llm.batches == [3]